@@ -1,10 +1,12 @@
 import streamlit as st
 from datetime import datetime
-from models.persona import PersonaManager
-from chat.interface import ChatInterface
-from template_management_ui import render_template_management
+from chat.interface import ChatInterface, get_persona_manager
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from types import MappingProxyType
 
 # Configure the Streamlit page - must be first Streamlit command
 st.set_page_config(page_title="AI Persona Lab", layout="wide", page_icon="🤖", initial_sidebar_state="expanded")
@@ -38,40 +40,84 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def configure_logging():
+    """Route log records through a queue drained by a background thread.
+
+    Handlers then never block the script thread on I/O. Streamlit re-executes
+    this module on every rerun, so the handler is only installed once.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, QueueHandler) for h in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
 # Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger()
 
+# Occupations offered in the sidebar persona generator, mapped to the
+# occupation passed to the model (display label without the emoji)
+OCCUPATION_MAP = {
+    "Professor 👨‍🏫": "Professor",
+    "Engineer 👷": "Engineer",
+    "Artist 🎨": "Artist",
+    "Doctor 👨‍⚕️": "Doctor",
+    "Writer ✍️": "Writer",
+    "Chef 👨‍🍳": "Chef",
+}
+OCCUPATIONS = (*OCCUPATION_MAP, "Other")
+
+@st.cache_resource
+def get_chat_interface():
+    """Return the ChatInterface shared by all sessions."""
+    return ChatInterface()
+
+# Seconds before the cached Ollama model list is fetched again
+MODEL_LIST_TTL = 30
+
+@st.cache_resource(ttl=MODEL_LIST_TTL, show_spinner=False)
+def get_model_catalog():
+    """Return the Ollama models and a name -> selectbox index map.
+
+    Both are immutable, so cache_resource shares them instead of handing out a
+    copy per call, and they always refresh together.
+    """
+    models = tuple(get_persona_manager().get_available_models())
+    return models, MappingProxyType({m: i for i, m in enumerate(models)})
+
+def get_available_models():
+    """Return the Ollama model list, refreshed every MODEL_LIST_TTL seconds."""
+    return get_model_catalog()[0]
+
+def get_model_indices():
+    """Return the model name -> index map for get_available_models()."""
+    return get_model_catalog()[1]
+
+# Per-session defaults; each factory only runs when its key is missing. The
+# model settings stay per-user: widgets write them to session state only, never
+# back into the PersonaManager shared by every session.
+SESSION_DEFAULTS = {
+    'persona_manager': get_persona_manager,
+    'chat_interface': get_chat_interface,
+    'selected_model': lambda: st.session_state.persona_manager.get_settings().get("default_model", "mistral:instruct"),
+    'temperature': lambda: st.session_state.persona_manager.get_settings().get("default_temperature", 0.7),
+    'max_tokens': lambda: st.session_state.persona_manager.get_settings().get("default_max_tokens", 500),
+    # Check for admin mode from environment
+    'is_admin': lambda: os.getenv('ADMIN_MODE', 'false').lower() == 'true',
+}
+
 def initialize_session_state():
     """Initialize session state with default values."""
-    if 'persona_manager' not in st.session_state:
-        st.session_state.persona_manager = PersonaManager()
-    if 'chat_interface' not in st.session_state:
-        st.session_state.chat_interface = ChatInterface()
-    if 'selected_model' not in st.session_state:
-        st.session_state.selected_model = st.session_state.persona_manager.settings.get("default_model", "mistral:instruct")
-    if 'temperature' not in st.session_state:
-        st.session_state.temperature = st.session_state.persona_manager.settings.get("default_temperature", 0.7)
-    if 'max_tokens' not in st.session_state:
-        st.session_state.max_tokens = st.session_state.persona_manager.settings.get("default_max_tokens", 500)
-    if 'is_admin' not in st.session_state:
-        # Check for admin mode from environment
-        st.session_state.is_admin = os.getenv('ADMIN_MODE', 'false').lower() == 'true'
-
-def on_model_change():
-    """Callback when model changes."""
-    st.session_state.persona_manager.settings["default_model"] = st.session_state.selected_model
-
-def on_temperature_change():
-    """Callback when temperature changes."""
-    st.session_state.persona_manager.settings["default_temperature"] = st.session_state.temperature
-
-def on_tokens_change():
-    """Callback when max tokens changes."""
-    st.session_state.persona_manager.settings["default_max_tokens"] = st.session_state.max_tokens
+    for key, default in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = default()
 
 def generate_persona(occupation):
     """Generate a new persona with the given occupation"""
@@ -95,19 +141,18 @@ def render_model_settings():
     """Render model settings section in sidebar."""
     with st.sidebar:
         with st.expander("⚙️ Model Settings", expanded=False):
-            available_models = st.session_state.persona_manager.get_available_models()
+            available_models = get_available_models()
             if not available_models:
                 st.error("No Ollama models available. Please install models using 'ollama pull <model>'")
                 return
             
             # Model selection
-            model_index = available_models.index(st.session_state.selected_model) if st.session_state.selected_model in available_models else 0
+            model_index = get_model_indices().get(st.session_state.selected_model, 0)
             st.selectbox(
                 "Model",
                 options=available_models,
                 index=model_index,
                 key='selected_model',
-                on_change=on_model_change,
                 help="Select the default model for generating personas and responses"
             )
             
@@ -118,7 +163,6 @@ def render_model_settings():
                 max_value=1.0,
                 step=0.1,
                 key='temperature',
-                on_change=on_temperature_change,
                 help="Higher values make output more random, lower values more deterministic"
             )
 
@@ -129,10 +173,182 @@ def render_model_settings():
                 max_value=2000,
                 step=50,
                 key='max_tokens',
-                on_change=on_tokens_change,
                 help="Maximum number of tokens in model responses"
             )
 
+def format_timestamp(dt):
+    """Format a persona timestamp for display."""
+    return dt.strftime('%Y-%m-%d %H:%M')
+
+def edit_text_field(persona, field, title, now, *, label=None, name=None):
+    """Render an expander with a form that edits one free-text persona field.
+
+    ``label`` (the text area label) defaults to ``title``, and ``name`` (used in
+    the button and success message) defaults to ``label``.
+    """
+    label = label or title
+    name = name or label
+    with st.expander(title, expanded=False):
+        with st.form(f"{field}_{persona.id}"):
+            new_value = st.text_area(label, value=getattr(persona, field), height=100)
+            if st.form_submit_button(f"Update {name}"):
+                setattr(persona, field, new_value)
+                persona.modified_at = now
+                st.session_state.persona_manager.mark_dirty(persona.id)
+                st.success(f"{name} updated!")
+
+@st.fragment
+def render_persona(persona):
+    """Render the detail view for a single persona.
+
+    Runs as a fragment so submitting one of its forms only reruns this view;
+    the submit itself triggers that rerun, so handlers don't call st.rerun().
+    """
+    pm = st.session_state.persona_manager
+    # One timestamp per run for every edit made in it
+    now = datetime.now()
+
+    # Layout with columns
+    left_col, right_col = st.columns([1, 3])
+    
+    with left_col:
+        st.image(persona.avatar, width=200)
+        # Filled in after the form so a rename shows without another rerun
+        name_header = st.empty()
+        with st.expander("Basic Information", expanded=False):
+            with st.form(f"basic_info_{persona.id}"):
+                new_name = st.text_input("Name", value=persona.name)
+                new_age = st.number_input("Age", min_value=25, max_value=65, value=persona.age)
+                new_nationality = st.text_input("Nationality", value=persona.nationality)
+                new_occupation = st.text_input("Occupation", value=persona.occupation)
+                
+                if st.form_submit_button("Update Basic Info"):
+                    persona.name = new_name
+                    persona.age = new_age
+                    persona.nationality = new_nationality
+                    persona.occupation = new_occupation
+                    persona.modified_at = now
+                    pm.mark_dirty(persona.id)
+                    st.success("Basic information updated!")
+        name_header.markdown(f"### {persona.name}")
+    
+    with right_col:
+        # Background section
+        edit_text_field(persona, "background", "Background & Story", now, label="Background")
+        
+        # Personality section
+        edit_text_field(persona, "personality", "Personality", now)
+        
+        # Daily Routine section
+        edit_text_field(persona, "routine", "Daily Routine", now, name="Routine")
+        
+        # Skills section
+        with st.expander("Skills", expanded=False):
+            with st.form(f"skills_{persona.id}"):
+                # Skills as a comma-separated list
+                skills_str = ", ".join(persona.skills)
+                new_skills = st.text_area(
+                    "Skills (comma-separated)",
+                    value=skills_str,
+                    height=100,
+                    help="Enter skills separated by commas"
+                )
+                if st.form_submit_button("Update Skills"):
+                    persona.skills = [s.strip() for s in new_skills.split(",") if s.strip()]
+                    persona.modified_at = now
+                    pm.mark_dirty(persona.id)
+                    st.success("Skills updated!")
+        
+        # Model Settings section
+        with st.expander("Model Settings", expanded=False):
+            with st.form(f"model_settings_{persona.id}"):
+                models = get_available_models()
+                if not models:
+                    st.error("No Ollama models available. Please install models using 'ollama pull <model>'")
+                else:
+                    new_model = st.selectbox(
+                        "Model",
+                        options=models,
+                        index=get_model_indices().get(persona.model, 0),
+                        help="Select the model for this persona"
+                    )
+                    
+                    new_temperature = st.slider(
+                        "Temperature",
+                        min_value=0.0,
+                        max_value=1.0,
+                        value=persona.temperature,
+                        step=0.1,
+                        help="Higher values make output more random, lower values more deterministic"
+                    )
+                    
+                    new_max_tokens = st.number_input(
+                        "Max Tokens",
+                        min_value=50,
+                        max_value=2000,
+                        value=persona.max_tokens,
+                        step=50,
+                        help="Maximum number of tokens in responses"
+                    )
+                    
+                    if st.form_submit_button("Update Model Settings"):
+                        persona.model = new_model
+                        persona.temperature = new_temperature
+                        persona.max_tokens = new_max_tokens
+                        persona.modified_at = now
+                        pm.mark_dirty(persona.id)
+                        st.success("Model settings updated!")
+        
+        # Notes section
+        edit_text_field(persona, "notes", "Notes", now)
+        
+        # Tags section
+        with st.expander("Tags", expanded=False):
+            with st.form(f"tags_{persona.id}"):
+                # Show existing tags with a single removal picker
+                tags_summary = st.empty()
+                tags_to_remove = st.multiselect(
+                    "Remove Tags",
+                    options=persona.tags,
+                    key=f"remove_tags_{persona.id}"
+                )
+                
+                # Add new tag
+                new_tag = st.text_input("Add New Tag")
+                
+                if st.form_submit_button("Update Tags"):
+                    # Remove selected tags
+                    for tag in tags_to_remove:
+                        persona.tags.remove(tag)
+                    
+                    # Add new tag if provided
+                    if new_tag and new_tag not in persona.tags:
+                        persona.tags.append(new_tag)
+                    
+                    persona.modified_at = now
+                    pm.mark_dirty(persona.id)
+                    st.success("Tags updated!")
+                tags_summary.write(f"Current Tags: {', '.join(persona.tags) or 'None'}")
+        
+        # Show metadata at the bottom
+        with st.expander("Metadata", expanded=False):
+            st.write(f"Created: {format_timestamp(persona.created_at)}")
+            st.write(f"Last Modified: {format_timestamp(persona.modified_at)}")
+
+        # Delete persona button
+        with st.expander("Danger Zone", expanded=False):
+            st.warning("This action cannot be undone!")
+            if st.button(f"Delete {persona.name}", key=f"delete_{persona.id}", type="primary"):
+                if pm.remove_persona(persona.id):
+                    st.session_state.pop("active_persona_id", None)
+                    st.success(f"Deleted persona: {persona.name}")
+                    st.rerun()
+                else:
+                    st.error("Failed to delete persona")
+
+    # Write edits once per run; fragment reruns never reach the end of main()
+    pm.flush_if_dirty()
+
 def main():
     # Initialize session state
     initialize_session_state()
@@ -147,25 +363,24 @@ def main():
     )
 
     if app_mode == "🎯 Template Management":
+        # Imported on demand; most sessions never open this mode
+        from template_management_ui import render_template_management
         render_template_management()
         return
 
-    # Initialize an empty list of personas if none exist
-    personas = st.session_state.persona_manager.list_personas()
+    pm = st.session_state.persona_manager
+
+    # Start with a default persona if none exist
+    personas = pm.list_personas()
     if not personas:
-        st.session_state.persona_manager.create_default_persona()
-        personas = st.session_state.persona_manager.list_personas()
+        personas = [pm.create_default_persona()]
 
     # Sidebar for controls
     with st.sidebar:
         st.title("Manage Personas")
         
         # Occupation dropdown
-        occupations = [
-            "Professor 👨‍🏫", "Engineer 👷", "Artist 🎨",
-            "Doctor 👨‍⚕️", "Writer ✍️", "Chef 👨‍🍳", "Other"
-        ]
-        selected_occupation = st.selectbox("Select Occupation", occupations)
+        selected_occupation = st.selectbox("Select Occupation", OCCUPATIONS)
         
         # Custom occupation input if "Other" is selected
         if selected_occupation == "Other":
@@ -177,9 +392,7 @@ def main():
                     st.warning("Please enter an occupation")
         else:
             if st.button("Generate Persona"):
-                # Remove emoji from occupation
-                occupation = selected_occupation.split(" ")[0]
-                generate_persona(occupation)
+                generate_persona(OCCUPATION_MAP[selected_occupation])
     
     # Render model settings
     render_model_settings()
@@ -191,205 +404,22 @@ def main():
         st.info("Add some personas using the sidebar to start chatting!")
         return
     
-    # Display detailed persona information in tabs
-    tabs = st.tabs([f"{p.name}" for p in personas])
-    
-    for idx, tab in enumerate(tabs):
-        with tab:
-            persona = personas[idx]
-            
-            # Layout with columns
-            left_col, right_col = st.columns([1, 3])
-            
-            with left_col:
-                st.image(persona.avatar, width=200)
-                st.markdown(f"### {persona.name}")
-                with st.expander("Basic Information", expanded=False):
-                    with st.form(f"basic_info_{persona.id}"):
-                        new_name = st.text_input("Name", value=persona.name)
-                        new_age = st.number_input("Age", min_value=25, max_value=65, value=persona.age)
-                        new_nationality = st.text_input("Nationality", value=persona.nationality)
-                        new_occupation = st.text_input("Occupation", value=persona.occupation)
-                        
-                        if st.form_submit_button("Update Basic Info"):
-                            persona.name = new_name
-                            persona.age = new_age
-                            persona.nationality = new_nationality
-                            persona.occupation = new_occupation
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Basic information updated!")
-                            st.rerun()
-            
-            with right_col:
-                # Background section
-                with st.expander("Background & Story", expanded=False):
-                    with st.form(f"background_{persona.id}"):
-                        new_background = st.text_area(
-                            "Background",
-                            value=persona.background,
-                            height=100
-                        )
-                        if st.form_submit_button("Update Background"):
-                            persona.background = new_background
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Background updated!")
-                            st.rerun()
-                
-                # Personality section
-                with st.expander("Personality", expanded=False):
-                    with st.form(f"personality_{persona.id}"):
-                        new_personality = st.text_area(
-                            "Personality",
-                            value=persona.personality,
-                            height=100
-                        )
-                        if st.form_submit_button("Update Personality"):
-                            persona.personality = new_personality
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Personality updated!")
-                            st.rerun()
-                
-                # Daily Routine section
-                with st.expander("Daily Routine", expanded=False):
-                    with st.form(f"routine_{persona.id}"):
-                        new_routine = st.text_area(
-                            "Daily Routine",
-                            value=persona.routine,
-                            height=100
-                        )
-                        if st.form_submit_button("Update Routine"):
-                            persona.routine = new_routine
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Routine updated!")
-                            st.rerun()
-                
-                # Skills section
-                with st.expander("Skills", expanded=False):
-                    with st.form(f"skills_{persona.id}"):
-                        # Skills as a comma-separated list
-                        skills_str = ", ".join(persona.skills)
-                        new_skills = st.text_area(
-                            "Skills (comma-separated)",
-                            value=skills_str,
-                            height=100,
-                            help="Enter skills separated by commas"
-                        )
-                        if st.form_submit_button("Update Skills"):
-                            persona.skills = [s.strip() for s in new_skills.split(",") if s.strip()]
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Skills updated!")
-                            st.rerun()
-                
-                # Model Settings section
-                with st.expander("Model Settings", expanded=False):
-                    with st.form(f"model_settings_{persona.id}"):
-                        models = st.session_state.persona_manager.get_available_models()
-                        if not models:
-                            st.error("No Ollama models available. Please install models using 'ollama pull <model>'")
-                        else:
-                            new_model = st.selectbox(
-                                "Model",
-                                options=models,
-                                index=models.index(persona.model) if persona.model in models else 0,
-                                help="Select the model for this persona"
-                            )
-                            
-                            new_temperature = st.slider(
-                                "Temperature",
-                                min_value=0.0,
-                                max_value=1.0,
-                                value=persona.temperature,
-                                step=0.1,
-                                help="Higher values make output more random, lower values more deterministic"
-                            )
-                            
-                            new_max_tokens = st.number_input(
-                                "Max Tokens",
-                                min_value=50,
-                                max_value=2000,
-                                value=persona.max_tokens,
-                                step=50,
-                                help="Maximum number of tokens in responses"
-                            )
-                            
-                            if st.form_submit_button("Update Model Settings"):
-                                persona.model = new_model
-                                persona.temperature = new_temperature
-                                persona.max_tokens = new_max_tokens
-                                persona.modified_at = datetime.now()
-                                st.session_state.persona_manager._save_personas()
-                                st.success("Model settings updated!")
-                                st.rerun()
-                
-                # Notes section
-                with st.expander("Notes", expanded=False):
-                    with st.form(f"notes_{persona.id}"):
-                        new_notes = st.text_area(
-                            "Notes",
-                            value=persona.notes,
-                            height=100
-                        )
-                        if st.form_submit_button("Update Notes"):
-                            persona.notes = new_notes
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Notes updated!")
-                            st.rerun()
-                
-                # Tags section
-                with st.expander("Tags", expanded=False):
-                    with st.form(f"tags_{persona.id}"):
-                        # Show existing tags with delete buttons
-                        st.write("Current Tags:")
-                        tags_to_remove = []
-                        for tag in persona.tags:
-                            col1, col2 = st.columns([3, 1])
-                            with col1:
-                                st.write(f"• {tag}")
-                            with col2:
-                                if st.checkbox("Remove", key=f"remove_tag_{persona.id}_{tag}"):
-                                    tags_to_remove.append(tag)
-                        
-                        # Add new tag
-                        new_tag = st.text_input("Add New Tag")
-                        
-                        if st.form_submit_button("Update Tags"):
-                            # Remove selected tags
-                            for tag in tags_to_remove:
-                                persona.tags.remove(tag)
-                            
-                            # Add new tag if provided
-                            if new_tag and new_tag not in persona.tags:
-                                persona.tags.append(new_tag)
-                            
-                            persona.modified_at = datetime.now()
-                            st.session_state.persona_manager._save_personas()
-                            st.success("Tags updated!")
-                            st.rerun()
-                
-                # Show metadata at the bottom
-                with st.expander("Metadata", expanded=False):
-                    st.write(f"Created: {persona.created_at.strftime('%Y-%m-%d %H:%M')}")
-                    st.write(f"Last Modified: {persona.modified_at.strftime('%Y-%m-%d %H:%M')}")
-
-                # Delete persona button
-                with st.expander("Danger Zone", expanded=False):
-                    st.warning("This action cannot be undone!")
-                    if st.button(f"Delete {persona.name}", key=f"delete_{persona.id}", type="primary"):
-                        if st.session_state.persona_manager.remove_persona(persona.id):
-                            st.success(f"Deleted persona: {persona.name}")
-                            st.rerun()
-                        else:
-                            st.error("Failed to delete persona")
+    # Display one persona at a time so only its widgets are built per rerun.
+    # Options are ids so the selection survives other personas being removed.
+    personas_by_id = {p.id: p for p in personas}
+    selected_id = st.sidebar.selectbox(
+        "Persona",
+        list(personas_by_id),
+        format_func=lambda pid: personas_by_id[pid].name,
+        key="active_persona_id"
+    )
+    persona = personas_by_id[selected_id]
     
+    render_persona(persona)
+
     # Chat interface at the bottom
     st.markdown("---")
-    st.session_state.chat_interface.render()
+    st.session_state.chat_interface.render(personas)
 
 if __name__ == "__main__":
     main()
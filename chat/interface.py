@@ -1,146 +1,116 @@
+import atexit
+import queue
+import re
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 
-import requests
+import orjson
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from adaptive_prompts import AdaptivePromptManager
 
+# Records prompt usage off the response path; drained at interpreter exit so
+# the last turn's telemetry is still written
+_TELEMETRY_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="telemetry")
+atexit.register(_TELEMETRY_POOL.shutdown, wait=True)
+
+# (connect, read) timeout for chat requests. Responses are streamed, so the
+# read timeout bounds each wait for the next chunk, not the whole reply; it is
+# generous because the first chunk waits for the model to load and prefill.
+CHAT_REQUEST_TIMEOUT = (3.05, 300)
+
+# Chat messages kept for redrawing; older ones drop off the front
+MAX_CHAT_MESSAGES = 500
+# Most recent messages passed to personas as conversation context
+CONTEXT_MESSAGES = 3
+
+# Words used for the relevance part of the response quality score
+_WORD_RE = re.compile(r"\w+")
+
+# Occupations offered by the Create New Persona form
+_OCCUPATIONS = (
+    "Business Owner",
+    "Marketing Manager",
+    "Finance Director",
+    "Sales Representative",
+    "Customer Service Manager",
+    "Operations Manager",
+    "Other",
+)
+
+
+@st.cache_resource
+def get_persona_manager():
+    """Return the PersonaManager shared by all sessions."""
+    # Lazy import to avoid circulars in some environments
+    from models.persona import PersonaManager
+
+    return PersonaManager()
+
+
+def _record_usage_async(prompt_manager, **usage):
+    """Queue ``prompt_manager.record_usage`` on the telemetry pool."""
+
+    def _report(future):
+        if future.exception() is not None:
+            print(f"Error recording prompt usage: {future.exception()}")
+
+    _TELEMETRY_POOL.submit(prompt_manager.record_usage, **usage).add_done_callback(
+        _report
+    )
+
 
 class ChatInterface:
     def __init__(self):
+        # Deferred so importing this module doesn't pay for requests up front
+        from models.persona import (
+            MAX_PARALLEL_REQUESTS,
+            OLLAMA_GENERATE_URL,
+            OLLAMA_SESSION,
+        )
+
+        # Keep-alive connections to Ollama, shared with persona generation
+        self._session = OLLAMA_SESSION
+        self._generate_url = OLLAMA_GENERATE_URL
+        self._max_parallel = MAX_PARALLEL_REQUESTS
+
+    def _init_session_state(self):
+        """Initialize the per-session chat state.
+
+        The interface itself is shared across sessions, so this runs on every
+        render rather than once in ``__init__``.
+        """
         if "messages" not in st.session_state:
-            st.session_state.messages = []
-        if "active_personas" not in st.session_state:
-            st.session_state.active_personas = set()
+            st.session_state.messages = deque(maxlen=MAX_CHAT_MESSAGES)
+        if "context_tail" not in st.session_state:
+            st.session_state.context_tail = deque(
+                st.session_state.messages, maxlen=CONTEXT_MESSAGES
+            )
         if "persona_active_states" not in st.session_state:
             st.session_state.persona_active_states = {}
 
         # Initialize adaptive prompt manager
         if "adaptive_prompt_manager" not in st.session_state:
             st.session_state.adaptive_prompt_manager = AdaptivePromptManager()
-        # Ensure persona manager is available for rendering and actions
-        if (
-            "persona_manager" not in st.session_state
-            or st.session_state.persona_manager is None
-        ):
-            # Lazy import to avoid circulars in some environments
-            from models.persona import PersonaManager
-
-            st.session_state.persona_manager = PersonaManager()
-
-    def render(self):
-        """Render the chat interface."""
-        # Sidebar for persona management
-        with st.sidebar:
-            st.header("Manage Personas")
-
-            # Create Persona Form
-            with st.expander("Create New Persona", expanded=False):
-                occupations = [
-                    "Business Owner",
-                    "Marketing Manager",
-                    "Finance Director",
-                    "Sales Representative",
-                    "Customer Service Manager",
-                    "Operations Manager",
-                    "Other",
-                ]
 
-                with st.form("create_persona_form"):
-                    selected_occupation = st.selectbox(
-                        "Select Occupation",
-                        options=occupations,
-                        key="occupation_select",
-                    )
+    def render(self, personas=None):
+        """Render the chat interface.
 
-                    # Show custom input if "Other" is selected
-                    custom_occupation = None
-                    if selected_occupation == "Other":
-                        custom_occupation = st.text_input("Enter Custom Occupation")
-
-                    if st.form_submit_button("🎯 Generate Persona"):
-                        # Determine which occupation to use
-                        occupation_to_use = (
-                            custom_occupation
-                            if selected_occupation == "Other"
-                            else selected_occupation
-                        )
+        ``personas`` lets the caller pass the list it already fetched this run;
+        it is loaded from the persona manager when omitted.
+        """
+        self._init_session_state()
 
-                        if selected_occupation == "Other" and not custom_occupation:
-                            st.error("Please enter a custom occupation")
-                            return
+        if personas is None:
+            personas = get_persona_manager().list_personas()
 
-                        try:
-                            settings = st.session_state.persona_manager.get_settings()
-                            if not settings.get("default_model"):
-                                st.error("Please select a model in settings first!")
-                                return
-
-                            with st.spinner(
-                                f"Generating {occupation_to_use} persona..."
-                            ):
-                                persona = (
-                                    st.session_state.persona_manager.generate_persona(
-                                        occupation=occupation_to_use,
-                                        model=settings.get("default_model"),
-                                        temperature=settings.get(
-                                            "default_temperature", 0.7
-                                        ),
-                                        max_tokens=settings.get(
-                                            "default_max_tokens", 150
-                                        ),
-                                    )
-                                )
-                                if persona:
-                                    # Set new persona as active by default
-                                    st.session_state.active_personas.add(persona.id)
-                                    st.session_state.persona_active_states[
-                                        persona.id
-                                    ] = True
-                                    st.success(
-                                        f"Created {persona.name}, the {persona.occupation}!"
-                                    )
-                                    st.rerun()
-                        except Exception as e:
-                            st.error(f"Error: {str(e)}")
-
-            # Current Personas section
-            st.subheader("Current Personas")
-            # Guard: ensure persona manager exists
-            if (
-                "persona_manager" not in st.session_state
-                or st.session_state.persona_manager is None
-            ):
-                from models.persona import PersonaManager
-
-                st.session_state.persona_manager = PersonaManager()
-            personas = st.session_state.persona_manager.list_personas()
-            for persona in personas:
-                col1, col2 = st.columns([1, 3])
-                with col1:
-                    st.image(persona.avatar, width=50)
-                with col2:
-                    st.write(f"**{persona.name}**")
-                    st.write(f"*{persona.occupation}*")
-
-                # Get the saved state or default to True for new personas
-                is_active = st.session_state.persona_active_states.get(persona.id, True)
-
-                def _on_toggle(pid=persona.id):
-                    toggled = st.session_state[f"toggle_{pid}"]
-                    if toggled:
-                        st.session_state.active_personas.add(pid)
-                    else:
-                        st.session_state.active_personas.discard(pid)
-                    st.session_state.persona_active_states[pid] = toggled
-
-                st.toggle(
-                    "Active",
-                    value=is_active,
-                    key=f"toggle_{persona.id}",
-                    on_change=_on_toggle,
-                )
-                st.divider()
+        # Sidebar for persona management. The fragment has to be called from
+        # inside the sidebar, since fragments can't write to it themselves.
+        with st.sidebar:
+            self._render_sidebar(personas)
 
         # Main chat area
         # Display chat messages
@@ -151,39 +121,181 @@ class ChatInterface:
         # Chat input
         if prompt := st.chat_input("Type your message..."):
             # Add user message
-            st.session_state.messages.append(
-                {"role": "user", "content": prompt, "name": "You"}
-            )
+            self._append_message({"role": "user", "content": prompt, "name": "You"})
 
             # Get responses from active personas
-            active_personas = [
-                p for p in personas if p.id in st.session_state.active_personas
-            ]
-
-            for persona in active_personas:
-                response = self._get_persona_response(persona, prompt)
-                st.session_state.messages.append(
-                    {
-                        "role": "assistant",
-                        "content": response,
-                        "name": persona.name,
-                        "avatar": persona.avatar,
-                    }
+            # Personas default to active, matching their toggle's initial value
+            active_states = st.session_state.persona_active_states
+            active_personas = [p for p in personas if active_states.get(p.id, True)]
+
+            with st.chat_message("user"):
+                st.markdown(f"**You:** {prompt}")
+
+            # Responses are I/O-bound, so request them all at once. Each worker
+            # feeds its persona's tokens into a queue that is streamed to the
+            # page in persona order, so later personas buffer while earlier
+            # ones are shown. Workers get this run's script context so they
+            # can read st.session_state.
+            # Shared by every persona this turn
+            context = self._get_conversation_context()
+            user_words = frozenset(_WORD_RE.findall(prompt.lower()))
+
+            def _pump(persona, tokens):
+                try:
+                    for token in self._stream_persona_response(
+                        persona, prompt, context, user_words
+                    ):
+                        tokens.put(token)
+                finally:
+                    tokens.put(None)
+
+            if active_personas:
+                with ThreadPoolExecutor(
+                    max_workers=min(self._max_parallel, len(active_personas)),
+                    initializer=add_script_run_ctx,
+                    initargs=(None, get_script_run_ctx()),
+                ) as executor:
+                    # Submit personas grouped by model, and by system prompt
+                    # within a model, so Ollama serves one loaded model at a
+                    # time and matching prompt prefixes can reuse its KV cache.
+                    # Replies are still shown in sidebar order.
+                    streams = [(persona, queue.Queue()) for persona in active_personas]
+                    for persona, tokens in sorted(
+                        streams, key=lambda s: (s[0].model, s[0].system_prompt)
+                    ):
+                        executor.submit(_pump, persona, tokens)
+
+                    for persona, tokens in streams:
+                        prefix = f"**{persona.name}:** "
+                        with st.chat_message("assistant", avatar=persona.avatar):
+                            shown = st.write_stream(
+                                chain([prefix], iter(tokens.get, None))
+                            )
+                        self._append_message(
+                            {
+                                "role": "assistant",
+                                "content": shown[len(prefix) :].strip(),
+                                "name": persona.name,
+                                "avatar": persona.avatar,
+                            }
+                        )
+
+    @st.fragment
+    def _render_sidebar(self, personas):
+        """Render persona creation and the active-persona toggles.
+
+        Runs as a fragment so a toggle only reruns the sidebar instead of
+        redrawing the whole chat history. Creating a persona still reruns the
+        full app so the new persona shows up everywhere.
+        """
+        pm = get_persona_manager()
+
+        st.header("Manage Personas")
+
+        # Create Persona Form
+        with st.expander("Create New Persona", expanded=False):
+            with st.form("create_persona_form"):
+                selected_occupation = st.selectbox(
+                    "Select Occupation",
+                    options=_OCCUPATIONS,
+                    key="occupation_select",
                 )
 
-            # Rerun to update the chat display
-            st.rerun()
+                # Show custom input if "Other" is selected
+                custom_occupation = None
+                if selected_occupation == "Other":
+                    custom_occupation = st.text_input("Enter Custom Occupation")
+
+                if st.form_submit_button("🎯 Generate Persona"):
+                    # Determine which occupation to use
+                    occupation_to_use = (
+                        custom_occupation
+                        if selected_occupation == "Other"
+                        else selected_occupation
+                    )
+
+                    if selected_occupation == "Other" and not custom_occupation:
+                        st.error("Please enter a custom occupation")
+                        return
+
+                    try:
+                        # This user's sidebar model settings, falling back to
+                        # the saved defaults
+                        settings = pm.get_settings()
+                        model = st.session_state.get(
+                            "selected_model", settings.get("default_model")
+                        )
+                        if not model:
+                            st.error("Please select a model in settings first!")
+                            return
+
+                        with st.spinner(f"Generating {occupation_to_use} persona..."):
+                            persona = pm.generate_persona(
+                                occupation=occupation_to_use,
+                                model=model,
+                                temperature=st.session_state.get(
+                                    "temperature",
+                                    settings.get("default_temperature", 0.7),
+                                ),
+                                max_tokens=st.session_state.get(
+                                    "max_tokens",
+                                    settings.get("default_max_tokens", 150),
+                                ),
+                            )
+                            if persona:
+                                # Set new persona as active by default
+                                active_states = st.session_state.persona_active_states
+                                active_states[persona.id] = True
+                                st.success(
+                                    f"Created {persona.name}, the {persona.occupation}!"
+                                )
+                                st.rerun()
+                    except Exception as e:
+                        st.error(f"Error: {str(e)}")
+
+        # Current Personas section
+        st.subheader("Current Personas")
+        for persona in personas:
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                st.image(persona.avatar, width=50)
+            with col2:
+                st.write(f"**{persona.name}**")
+                st.write(f"*{persona.occupation}*")
+
+            # Get the saved state or default to True for new personas
+            is_active = st.session_state.persona_active_states.get(persona.id, True)
+
+            def _on_toggle(pid=persona.id):
+                st.session_state.persona_active_states[pid] = st.session_state[
+                    f"toggle_{pid}"
+                ]
 
-    def _get_persona_response(self, persona, prompt: str) -> str:
-        """Get a response from a persona using the Ollama API with adaptive prompts."""
+            st.toggle(
+                "Active",
+                value=is_active,
+                key=f"toggle_{persona.id}",
+                on_change=_on_toggle,
+            )
+            st.divider()
+
+    def _stream_persona_response(
+        self, persona, prompt: str, context: str, user_words: frozenset
+    ):
+        """Stream a persona's response from the Ollama API with adaptive prompts.
+
+        Yields response text as Ollama generates it; usage is recorded once the
+        stream completes. ``context`` and ``user_words`` are computed once per
+        turn by the caller.
+        """
+        streamed = False
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
 
             # Get adaptive prompt manager
             prompt_manager = st.session_state.adaptive_prompt_manager
 
             # Get optimal template for this persona and context
-            context = self._get_conversation_context()
             optimal_template = prompt_manager.get_optimal_template(
                 persona=persona, context=context, user_message=prompt
             )
@@ -198,13 +310,7 @@ class ChatInterface:
 
             # Make the API call
             # Build a rich system prompt that includes persona details
-            system_prompt = (
-                f"You are {persona.name}, a {persona.age}-year-old {persona.nationality} {persona.occupation}.\n\n"
-                f"Background: {persona.background}\n"
-                f"Daily Routine: {persona.routine}\n"
-                f"Personality: {persona.personality}\n"
-                f"Skills: {', '.join(persona.skills)}"
-            )
+            system_prompt = persona.system_prompt
 
             # Augment the formatted prompt to include previous message and explicit instruction
             final_prompt = (
@@ -213,32 +319,45 @@ class ChatInterface:
                 f"Respond naturally as {persona.name}:"
             )
 
-            response = requests.post(
-                "http://localhost:11434/api/generate",
+            # Closing the response releases the socket even if the stream fails
+            with self._session.post(
+                self._generate_url,
                 json={
-                    "model": persona.model,
+                    **persona.ollama_payload_template,
                     "prompt": final_prompt,
                     "system": system_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": persona.temperature,
-                        "num_predict": persona.max_tokens,
-                    },
                 },
-                timeout=5,
-            )
-            response.raise_for_status()
-            result = response.json()
-            response_text = result["response"].strip()
+                timeout=CHAT_REQUEST_TIMEOUT,
+                stream=True,
+            ) as response:
+                response.raise_for_status()
+
+                # Read to the end of the body rather than breaking on "done";
+                # an undrained chunked response can't go back to the pool
+                chunks = []
+                done = False
+                for line in response.iter_lines():
+                    if done or not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    if chunk.get("response"):
+                        chunks.append(chunk["response"])
+                        streamed = True
+                        yield chunk["response"]
+                    done = bool(chunk.get("done"))
+            response_text = "".join(chunks).strip()
 
             # Calculate response time
-            response_time = time.time() - start_time
+            response_time = time.perf_counter() - start_time
 
             # Calculate quality score (basic heuristic)
-            quality_score = self._calculate_response_quality(response_text, prompt)
+            quality_score = self._calculate_response_quality(
+                response_text, user_words
+            )
 
             # Record usage for learning
-            prompt_manager.record_usage(
+            _record_usage_async(
+                prompt_manager,
                 template_id=optimal_template.id,
                 persona_id=persona.id,
                 context=context,
@@ -249,12 +368,11 @@ class ChatInterface:
                 success=True,
             )
 
-            return response_text
-
         except Exception as e:
             # Record failed usage
             if "optimal_template" in locals():
-                prompt_manager.record_usage(
+                _record_usage_async(
+                    prompt_manager,
                     template_id=optimal_template.id,
                     persona_id=persona.id,
                     context=context,
@@ -267,20 +385,24 @@ class ChatInterface:
                     success=False,
                 )
 
-            # Log detailed error server-side, but return a generic message to users
+            # Log detailed error server-side, but show a generic message to users
             print(f"Error getting response from {persona.name}: {str(e)}")
-            return "Sorry, I'm having trouble responding right now."
+            if not streamed:
+                yield "Sorry, I'm having trouble responding right now."
+
+    def _append_message(self, message: dict):
+        """Record a chat message for redrawing and for conversation context."""
+        st.session_state.messages.append(message)
+        st.session_state.context_tail.append(message)
 
     def _get_conversation_context(self) -> str:
         """Extract context from recent conversation messages."""
-        if not st.session_state.messages:
+        if not st.session_state.context_tail:
             return ""
 
-        # Get last 3 messages for context
-        recent_messages = st.session_state.messages[-3:]
         context_parts = []
 
-        for msg in recent_messages:
+        for msg in st.session_state.context_tail:
             if msg["role"] == "user":
                 context_parts.append(f"User: {msg['content']}")
             else:
@@ -290,8 +412,14 @@ class ChatInterface:
 
         return " | ".join(context_parts)
 
-    def _calculate_response_quality(self, response: str, user_prompt: str) -> float:
-        """Calculate a basic quality score for the response."""
+    def _calculate_response_quality(
+        self, response: str, user_words: frozenset
+    ) -> float:
+        """Calculate a basic quality score for the response.
+
+        ``user_words`` is the lowercased word set of the user's prompt, built
+        once per turn and shared by every persona's response.
+        """
         if not response or not response.strip():
             return 0.0
 
@@ -306,14 +434,11 @@ class ChatInterface:
             score += 0.1
 
         # Coherence (basic check for sentence structure)
-        sentences = response.split(".")
-        if len(sentences) >= 2:
+        if "." in response:
             score += 0.1
 
-        # Relevance (very basic keyword matching)
-        user_words = set(user_prompt.lower().split())
-        response_words = set(response.lower().split())
-        common_words = user_words.intersection(response_words)
+        # Relevance (very basic keyword matching) in one pass over the response
+        common_words = user_words.intersection(_WORD_RE.findall(response.lower()))
 
         if len(common_words) > 0:
             relevance_ratio = len(common_words) / len(user_words)
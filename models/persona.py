@@ -1,13 +1,105 @@
+import atexit
 import json
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Optional
 
+import orjson
 import requests
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 OLLAMA_API_URL = "http://localhost:11434/api"
+OLLAMA_GENERATE_URL = f"{OLLAMA_API_URL}/generate"
+
+# Keep-alive connection pool shared by every Ollama request. Retries cover
+# connection failures; urllib3 never replays a POST whose request was sent.
+OLLAMA_SESSION = requests.Session()
+OLLAMA_SESSION.mount(
+    "http://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    ),
+)
+
+DEFAULT_PARALLEL_REQUESTS = 8
+
+
+def _parallel_requests_from_env() -> int:
+    """Read OLLAMA_NUM_PARALLEL, falling back to the default when unusable.
+
+    Ollama treats 0 as "choose automatically", so only positive integers
+    are taken as an explicit limit.
+    """
+    try:
+        value = int(os.getenv("OLLAMA_NUM_PARALLEL", DEFAULT_PARALLEL_REQUESTS))
+    except ValueError:
+        return DEFAULT_PARALLEL_REQUESTS
+    return value if value > 0 else DEFAULT_PARALLEL_REQUESTS
+
+
+# Upper bound on requests sent to Ollama at once, for both chat replies and
+# batch persona generation. Ollama only decodes OLLAMA_NUM_PARALLEL requests per
+# model together and queues the rest, so the same variable sizes our pools.
+MAX_PARALLEL_REQUESTS = _parallel_requests_from_env()
+
+# Append-only persona log: one persona record or deletion tombstone per line
+PERSONAS_LOG_PATH = "data/personas.jsonl"
+# Whole-file JSON array used before the log; migrated on first load
+LEGACY_PERSONAS_PATH = "data/personas.json"
+
+SETTINGS_PATH = "data/settings.json"
+
+
+@lru_cache(maxsize=128)
+def _build_system_prompt(
+    name: str,
+    age: int,
+    nationality: str,
+    occupation: str,
+    background: str,
+    routine: str,
+    personality: str,
+    skills: tuple,
+) -> str:
+    """Build a persona's system prompt, memoized on the fields it uses.
+
+    Keying on the field values means an edited persona gets a fresh prompt
+    without any explicit invalidation.
+    """
+    return (
+        f"You are {name}, a {age}-year-old {nationality} {occupation}.\n\n"
+        f"Background: {background}\n"
+        f"Daily Routine: {routine}\n"
+        f"Personality: {personality}\n"
+        f"Skills: {', '.join(skills)}"
+    )
+
+
+@lru_cache(maxsize=128)
+def _build_chat_payload_template(
+    model: str, temperature: float, max_tokens: int
+) -> MappingProxyType:
+    """Build the fixed part of a streamed chat request for these settings.
+
+    Shared between calls, so it's read-only; callers spread it into a new
+    dict and must not mutate the nested ``options``.
+    """
+    return MappingProxyType(
+        {
+            "model": model,
+            "stream": True,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+        }
+    )
 
 
 class Persona(BaseModel):
@@ -29,50 +121,161 @@ class Persona(BaseModel):
     tags: List[str] = []
     notes: str = ""
 
+    @property
+    def system_prompt(self) -> str:
+        """System prompt describing this persona to the model.
+
+        Fields are edited in place, so this can't be a cached_property; the
+        memoized builder is keyed on the field values instead.
+        """
+        return _build_system_prompt(
+            self.name,
+            self.age,
+            self.nationality,
+            self.occupation,
+            self.background,
+            self.routine,
+            self.personality,
+            tuple(self.skills),
+        )
+
+    @property
+    def ollama_payload_template(self) -> MappingProxyType:
+        """Request fields for chatting as this persona, minus the prompts."""
+        return _build_chat_payload_template(
+            self.model, self.temperature, self.max_tokens
+        )
+
 
 class PersonaManager:
     def __init__(self):
-        self.personas = []
+        self._by_id: Dict[str, Persona] = {}
+        self._dirty = set()
+        # The manager is shared by every session's script thread; this guards
+        # _by_id, _dirty and appends to the log. Reentrant because saving runs
+        # inside other locked operations.
+        self._lock = threading.RLock()
+        # Don't lose edits from a run that stopped before flushing
+        atexit.register(self.flush_if_dirty)
         self.settings = {
             "default_model": None,
             "default_temperature": 0.7,
             "default_max_tokens": 1000,
         }
+        # mtime of settings.json when last read or written; None if unknown
+        self._settings_mtime: Optional[float] = None
         self._load_settings()
         self._load_personas()
 
     def _load_personas(self):
+        """Replay the persona log into memory, then compact it."""
+        # Replay raw records first so each surviving persona is validated once,
+        # not once per superseded edit in the log
+        records = {}
         try:
-            with open("data/personas.json", "r") as f:
+            with open(PERSONAS_LOG_PATH, "rb") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = orjson.loads(line)
+                        if record.get("deleted"):
+                            records.pop(record["id"], None)
+                        else:
+                            records[record["id"]] = record
+                    except (json.JSONDecodeError, AttributeError, KeyError, TypeError):
+                        # Skip a torn or invalid line, e.g. an interrupted append
+                        continue
+        except FileNotFoundError:
+            self._load_legacy_personas()
+        else:
+            self._by_id = {}
+            for persona_id, record in records.items():
+                try:
+                    self._by_id[persona_id] = Persona.model_validate(record)
+                except (TypeError, ValueError):
+                    continue
+        self._compact_personas()
+
+    def _load_legacy_personas(self):
+        """Load personas from the pre-log personas.json array, if present."""
+        try:
+            with open(LEGACY_PERSONAS_PATH, "rb") as f:
                 content = f.read()
-                data = json.loads(content) if content else []
-                self.personas = [Persona(**p) for p in data]
+                data = orjson.loads(content) if content else []
+                personas = [Persona.model_validate(p) for p in data]
         except (FileNotFoundError, json.JSONDecodeError, TypeError, ValueError):
-            self.personas = []
+            personas = []
+        self._by_id = {p.id: p for p in personas}
+
+    def _compact_personas(self):
+        """Rewrite the log as one record per live persona."""
+        os.makedirs(os.path.dirname(PERSONAS_LOG_PATH), exist_ok=True)
+        tmp_path = f"{PERSONAS_LOG_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{p.model_dump_json()}\n" for p in self._by_id.values())
+        os.replace(tmp_path, PERSONAS_LOG_PATH)
+
+    def _append_lines(self, lines: List[str]):
+        """Append JSON lines to the persona log."""
+        with open(PERSONAS_LOG_PATH, "a") as f:
+            f.writelines(f"{line}\n" for line in lines)
 
     def _save_personas(self):
-        with open("data/personas.json", "w") as f:
-            json.dump([p.dict() for p in self.personas], f, default=str)
+        """Append the current state of every dirty persona to the log."""
+        with self._lock:
+            # model_dump_json serializes in one pass, datetimes included
+            lines = [
+                self._by_id[pid].model_dump_json()
+                for pid in self._dirty
+                if pid in self._by_id
+            ]
+            if lines:
+                self._append_lines(lines)
+            self._dirty.clear()
+
+    def mark_dirty(self, persona_id: str):
+        """Record that a persona was edited in place and needs saving."""
+        with self._lock:
+            self._dirty.add(persona_id)
+
+    def flush_if_dirty(self) -> bool:
+        """Save personas if any were marked dirty since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._save_personas()
+            return True
+
+    def _load_settings(self, regenerate: bool = True):
+        """Load settings from settings.json
 
-    def _load_settings(self):
-        """Load settings from settings.json"""
+        A missing or invalid file is rewritten from the current settings only
+        when ``regenerate`` is set; reloads leave it alone so a half-written
+        edit isn't clobbered, and retry on the next call.
+        """
+        # Read the mtime first so a write racing with this load is seen later
+        mtime = self._read_settings_mtime()
         try:
-            with open("data/settings.json", "r") as f:
-                loaded_settings = json.load(f)
-                if isinstance(loaded_settings, dict):
-                    self.settings.update(loaded_settings)
-                else:
+            with open(SETTINGS_PATH, "rb") as f:
+                loaded_settings = orjson.loads(f.read())
+                if not isinstance(loaded_settings, dict):
                     # Unexpected content; regenerate default settings
                     raise ValueError("settings.json must contain a JSON object")
         except (FileNotFoundError, ValueError, json.JSONDecodeError):
-            self._save_settings()
+            if regenerate:
+                self._save_settings()
+            return
+        self.settings.update(loaded_settings)
+        self._settings_mtime = mtime
 
     def _save_settings(self):
         """Save settings to settings.json"""
         os.makedirs("data", exist_ok=True)
         try:
-            with open("data/settings.json", "w") as f:
-                json.dump(self.settings, f)
+            with open(SETTINGS_PATH, "wb") as f:
+                f.write(orjson.dumps(self.settings))
+            self._settings_mtime = self._read_settings_mtime()
         except Exception:
             # In testing contexts, open may be patched to raise; ignore persistence failures
             pass
@@ -83,39 +286,112 @@ class PersonaManager:
         self.settings.update(settings)
         self._save_settings()
 
+    def _read_settings_mtime(self) -> Optional[float]:
+        """Return settings.json's mtime, or None if it can't be read"""
+        try:
+            return os.path.getmtime(SETTINGS_PATH)
+        except OSError:
+            return None
+
     def get_settings(self) -> dict:
-        """Get current settings"""
+        """Get current settings, reloading settings.json if it changed on disk"""
+        if self._read_settings_mtime() != self._settings_mtime:
+            self._load_settings(regenerate=False)
         return self.settings.copy()
 
-    def generate_persona(
+    def _generation_options(
         self,
-        occupation: str,
         model: str = None,
         temperature: float = None,
         max_tokens: int = None,
-    ) -> Optional[Persona]:
-        """Generate a new persona with the given occupation using Ollama."""
+        count: int = 1,
+    ) -> List[tuple]:
+        """Fill in unset generation options from the settings.
+
+        Returns one (model, temperature, max_tokens) tuple per persona, with
+        the available models fetched at most once for all ``count`` of them.
+        """
+        settings = self.get_settings()
         # Use provided model or fall back to default
         if model is None:
-            model = self.settings.get("default_model")
+            model = settings.get("default_model")
 
-        # If still no model, try to get available models
-        if model is None:
+        if model is not None:
+            models = [model] * count
+        else:
+            # If still no model, try to get available models
             available_models = self.get_available_models()
-            if available_models:
-                # Rotate through available models for variety across personas
-                model_index = len(self.personas) % len(available_models)
-                model = available_models[model_index]
-            else:
+            if not available_models:
                 raise ValueError("No available models")
+            # Rotate through available models for variety across personas
+            start = len(self._by_id)
+            models = [
+                available_models[(start + i) % len(available_models)]
+                for i in range(count)
+            ]
 
         if temperature is None:
-            temperature = self.settings["default_temperature"]
+            temperature = settings["default_temperature"]
         if max_tokens is None:
-            max_tokens = self.settings["default_max_tokens"]
+            max_tokens = settings["default_max_tokens"]
 
         # Respect requested max_tokens without clamping
+        return [(m, temperature, max_tokens) for m in models]
+
+    def generate_persona(
+        self,
+        occupation: str,
+        model: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+    ) -> Optional[Persona]:
+        """Generate a new persona with the given occupation using Ollama."""
+        options = self._generation_options(model, temperature, max_tokens)[0]
+        new_persona = self._request_persona(occupation, *options)
+        if new_persona:
+            self._add_persona(new_persona)
+        return new_persona
+
+    def generate_personas(
+        self,
+        occupations: List[str],
+        model: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+    ) -> List[Optional[Persona]]:
+        """Generate one persona per occupation with concurrent Ollama requests.
+
+        Ollama decodes up to OLLAMA_NUM_PARALLEL requests per loaded model
+        together, so a batch takes about as long as its slowest persona.
+        Results are in the order of ``occupations``; failures are None.
+        """
+        if not occupations:
+            return []
 
+        options = self._generation_options(
+            model, temperature, max_tokens, count=len(occupations)
+        )
+        jobs = [
+            (occupation, *job_options)
+            for occupation, job_options in zip(occupations, options)
+        ]
+        workers = min(len(jobs), MAX_PARALLEL_REQUESTS)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            personas = list(pool.map(lambda job: self._request_persona(*job), jobs))
+
+        # Store on this thread so the batch goes out in a single append
+        with self._lock:
+            for persona in personas:
+                if persona:
+                    self._by_id[persona.id] = persona
+                    self._dirty.add(persona.id)
+            self._save_personas()
+        return personas
+
+    def _request_persona(
+        self, occupation: str, model: str, temperature: float, max_tokens: int
+    ) -> Optional[Persona]:
+        """Ask Ollama for a persona and validate it, without storing it."""
         prompt = f"""You are a JSON generator for creating detailed, realistic personas. You must ONLY output a valid JSON object - no other text.
         Generate a CONCISE persona for a {occupation} using this exact format:
 
@@ -141,64 +417,31 @@ IMPORTANT:
 4. Use proper JSON quotes and commas
 5. Ensure JSON is complete and valid"""
 
-        try:
-            response = requests.post(
-                f"{OLLAMA_API_URL}/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"temperature": temperature, "num_predict": max_tokens},
-                },
-            )
-            response.raise_for_status()
-
-            # Extract and validate the response
-            result = response.json()
-            try:
-                # Clean the response string
-                response_text = result["response"].strip()
-
-                # Find the JSON object
-                start_idx = response_text.find("{")
-                end_idx = response_text.rfind("}") + 1
-
-                if start_idx == -1 or end_idx == 0:
-                    print("Raw response:", response_text)
-                    raise ValueError("No JSON object found in response")
-
-                # Extract just the JSON part
-                json_text = response_text[start_idx:end_idx]
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            # Constrain decoding to a single valid JSON object
+            "format": "json",
+            "stream": False,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+        }
 
-                # Try to parse the JSON
+        response = None
+        try:
+            # JSON mode can still return a truncated object if generation hits
+            # num_predict, so allow one retry before giving up
+            for attempt in range(2):
+                response = OLLAMA_SESSION.post(
+                    OLLAMA_GENERATE_URL, json=payload
+                )
+                response.raise_for_status()
+                result = response.json()
                 try:
-                    persona_data = json.loads(json_text)
+                    persona_data = json.loads(result["response"])
+                    break
                 except json.JSONDecodeError:
-                    # If parsing fails, try to fix common issues
-                    # 1. Fix unterminated strings by adding missing quotes
-                    lines = json_text.split("\n")
-                    fixed_lines = []
-                    for i, line in enumerate(lines):
-                        line = line.rstrip()
-                        if (
-                            i < len(lines) - 1
-                            and ":" in line
-                            and not line.rstrip().endswith(",")
-                            and not line.rstrip().endswith("{")
-                        ):
-                            if line.count('"') % 2 == 1:  # Unterminated string
-                                line = line + '"'
-                            line = line + ","
-                        fixed_lines.append(line)
-                    json_text = "\n".join(fixed_lines)
-
-                    # Try parsing again
-                    persona_data = json.loads(json_text)
-
-            except Exception as e:
-                print("Raw response:", result["response"])
-                print("JSON error:", str(e))
-                raise ValueError("Invalid JSON response from model")
+                    if attempt:
+                        raise
 
             # Validate required fields
             required_fields = [
@@ -247,8 +490,6 @@ IMPORTANT:
                 modified_at=datetime.now(),
             )
 
-            self.personas.append(new_persona)
-            self._save_personas()
             return new_persona
 
         except json.JSONDecodeError as e:
@@ -262,18 +503,24 @@ IMPORTANT:
 
     def update_persona(self, persona: Persona):
         """Update an existing persona"""
-        for i, p in enumerate(self.personas):
-            if p.id == persona.id:
-                persona.modified_at = datetime.now()
-                self.personas[i] = persona
-                self._save_personas()
-                return True
-        return False
+        with self._lock:
+            if persona.id not in self._by_id:
+                return False
+            persona.modified_at = datetime.now()
+            self._add_persona(persona)
+            return True
+
+    def _add_persona(self, persona: Persona):
+        """Store a new or replaced persona and append it to the log."""
+        with self._lock:
+            self._by_id[persona.id] = persona
+            self._dirty.add(persona.id)
+            self._save_personas()
 
     def get_available_models(self) -> List[str]:
         """Get list of available Ollama models"""
         try:
-            response = requests.get(f"{OLLAMA_API_URL}/tags")
+            response = OLLAMA_SESSION.get(f"{OLLAMA_API_URL}/tags")
             if response.status_code == 200:
                 models_data = response.json()["models"]
                 return [model["name"] for model in models_data] if models_data else []
@@ -289,23 +536,28 @@ IMPORTANT:
 
     def list_personas(self) -> List[Persona]:
         """Return list of all personas."""
-        return self.personas
+        with self._lock:
+            return list(self._by_id.values())
 
     def get_persona(self, persona_id: str) -> Optional[Persona]:
         """Get a specific persona by ID."""
-        return next((p for p in self.personas if p.id == persona_id), None)
+        with self._lock:
+            return self._by_id.get(persona_id)
 
     def remove_persona(self, persona_id: str) -> bool:
         """Remove a persona by ID."""
-        persona = self.get_persona(persona_id)
-        if persona:
-            self.personas.remove(persona)
-            self._save_personas()
+        with self._lock:
+            if self._by_id.pop(persona_id, None) is None:
+                return False
+            self._dirty.discard(persona_id)
+            self._append_lines(
+                [orjson.dumps({"id": persona_id, "deleted": True}).decode()]
+            )
             return True
-        return False
 
     def create_default_persona(self):
         """Create a default persona to get users started"""
+        settings = self.get_settings()
         default_persona = {
             "id": str(uuid.uuid4()),
             "name": "Assistant",
@@ -323,12 +575,12 @@ IMPORTANT:
                 "Creative Thinking",
             ],
             "model": (
-                self.settings["default_model"]
-                if self.settings["default_model"] is not None
+                settings["default_model"]
+                if settings["default_model"] is not None
                 else "default_model_name"
             ),
-            "temperature": self.settings["default_temperature"],
-            "max_tokens": self.settings["default_max_tokens"],
+            "temperature": settings["default_temperature"],
+            "max_tokens": settings["default_max_tokens"],
             "notes": "Default assistant persona to help you get started with AI Persona Lab.",
             "tags": ["assistant", "helpful", "default"],
             "created_at": datetime.now(),
@@ -341,6 +593,5 @@ IMPORTANT:
 
         # Create and save the persona
         persona = Persona(**default_persona)
-        self.personas.append(persona)
-        self._save_personas()
+        self._add_persona(persona)
         return persona
@@ -3,11 +3,7 @@ import uuid
 from datetime import datetime
 from typing import Optional
 
-import requests
-
-from models.persona import Persona
-
-OLLAMA_API_URL = "http://localhost:11434/api"
+from models.persona import OLLAMA_GENERATE_URL, OLLAMA_SESSION, Persona
 
 PERSONA_PROMPT = """You are a creative AI assistant specializing in creating detailed, realistic personas. Generate a complete persona for a {occupation}.
 
@@ -47,8 +43,8 @@ def generate_persona(occupation: str) -> Optional[Persona]:
     response = None
     try:
         # Request JSON format explicitly
-        response = requests.post(
-            f"{OLLAMA_API_URL}/generate",
+        response = OLLAMA_SESSION.post(
+            OLLAMA_GENERATE_URL,
             json={
                 "model": "mistral:instruct",
                 # Avoid str.format brace conflicts by simple replacement